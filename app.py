@@ -1,11 +1,16 @@
 import streamlit as st
 import os
+import io
+import asyncio
 import tempfile
+import shutil
 import json
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import time
 import traceback
 import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 AUDIO_PROCESSOR_CLASS = None
 IMPORT_ERROR_TRACEBACK = None
@@ -15,9 +20,30 @@ try:
 except Exception:
     IMPORT_ERROR_TRACEBACK = traceback.format_exc()
 
+@st.cache_resource
+def get_processor():
+    """Build the AudioProcessor and its Gemini client once and share it across reruns and sessions."""
+    return AUDIO_PROCESSOR_CLASS()
+
+def get_session_prefix():
+    """Prefix for temp files so each session's files can be told apart."""
+    ctx = get_script_run_ctx()
+    return f"{ctx.session_id}_" if ctx else "session_"
+
+def store_word_timestamps(word_timestamps):
+    """Write word timestamps to a temp JSON file and return its path, keeping them out of session_state."""
+    with tempfile.NamedTemporaryFile('w', dir=get_temp_dir(), prefix=get_session_prefix(),
+                                     suffix=".json", delete=False, encoding='utf-8') as f:
+        json.dump(word_timestamps, f)
+        return f.name
+
+def load_word_timestamps(transcription_data):
+    """Read the word timestamps stored for one processed file."""
+    with open(transcription_data['word_timestamps_path'], 'r', encoding='utf-8') as f:
+        return json.load(f)
+
 from video_generator import VideoGenerator
-from mp3_embedder import MP3Embedder
-from utils import format_timestamp, validate_audio_file, get_audio_info
+from utils import CACHE_MAX_ENTRIES, format_timestamp, validate_audio_file, get_audio_info, get_temp_dir
 
 # Page configuration
 st.set_page_config(
@@ -26,47 +52,59 @@ st.set_page_config(
     layout="wide"
 )
 
-# --- Function to log messages to the browser console ---
+# --- Functions to log messages to the browser console ---
+# Script template for the console logger; %s is replaced with a JSON array of messages
+BROWSER_CONSOLE_JS = """
+<script>
+(function() {
+    const logs = %s;
+    console.group("Backend Logs from SyncMaster");
+    logs.forEach(log => {
+        if (typeof log === 'string' && log.startsWith('--- ERROR')) {
+            console.error(log);
+        } else if (typeof log === 'string' && log.startsWith('--- WARNING')) {
+            console.warn(log);
+        } else {
+            console.log(log);
+        }
+    });
+    console.groupEnd();
+})();
+</script>
+"""
+
 def log_to_browser_console(messages):
     """Injects JavaScript to log messages to the browser's console."""
     if isinstance(messages, str):
         messages = [messages]
     
-    # Escape backticks, backslashes, and ${} to prevent breaking the template literal
-    escaped_messages = []
-    for msg in messages:
-        # Simple JSON stringification is a safe way to escape the string for JS
-        escaped_messages.append(json.dumps(msg))
-
-    js_code = f"""
-    <script>
-    (function() {{
-        const logs = [{', '.join(escaped_messages)}];
-        console.group("Backend Logs from SyncMaster");
-        logs.forEach(log => {{
-            if (typeof log === 'string' && log.startsWith('--- ERROR')) {{
-                console.error(log);
-            }} else if (typeof log === 'string' && log.startsWith('--- WARNING')) {{
-                console.warn(log);
-            }} else {{
-                console.log(log);
-            }}
-        }});
-        console.groupEnd();
-    }})();
-    </script>
-    """
-    components.html(js_code, height=0)
+    # JSON is a safe way to escape the strings for JS; also keep "</script>" from closing the tag
+    payload = json.dumps(messages).replace("</", "<\\/")
+    components.html(BROWSER_CONSOLE_JS % payload, height=0)
+
+def queue_browser_logs(messages):
+    """Queue messages for the browser console; flush_browser_logs sends them in one component."""
+    if isinstance(messages, str):
+        messages = [messages]
+    st.session_state.setdefault('_pending_logs', []).extend(messages)
+
+def flush_browser_logs():
+    """Send all queued messages to the browser console at once."""
+    messages = st.session_state.pop('_pending_logs', [])
+    if messages:
+        log_to_browser_console(messages)
 
 # Initialize session state
 if 'step' not in st.session_state:
     st.session_state.step = 1
-if 'audio_file' not in st.session_state:
-    st.session_state.audio_file = None
+if 'audio_files' not in st.session_state:
+    st.session_state.audio_files = []
 if 'transcription_data' not in st.session_state:
     st.session_state.transcription_data = None
+if 'active_file' not in st.session_state:
+    st.session_state.active_file = None
 if 'edited_text' not in st.session_state:
-    st.session_state.edited_text = ""
+    st.session_state.edited_text = {}
 if 'video_style' not in st.session_state:
     st.session_state.video_style = {
         'animation_style': 'Karaoke Style',
@@ -77,36 +115,49 @@ if 'video_style' not in st.session_state:
         'font_size': 48
     }
 
+# --- Compatibility shims for older Streamlit releases ---
+# Checked once at import; current releases skip the signature inspection
+# and keep the original widget functions
+_ST_VERSION = tuple(int(part) for part in st.__version__.split(".")[:2] if part.isdigit())
+_NEEDS_WIDGET_PATCH = _ST_VERSION < (1, 20)
+
 if not hasattr(st, "divider"):
     def _divider():
         st.markdown("---")
     st.divider = _divider
 
-# Patch st.button for Streamlit versions that don't support the 'type' argument (<=1.12)
-import inspect as _st_inspect
-if "type" not in _st_inspect.signature(st.button).parameters:
-    _orig_button = st.button
+if not hasattr(st, "rerun") and hasattr(st, "experimental_rerun"):
+    st.rerun = st.experimental_rerun
 
-    def _patched_button(label, *args, **kwargs):
-        kwargs.pop("type", None)
-        kwargs.pop("use_container_width", None)
-        return _orig_button(label, *args, **kwargs)
+if _NEEDS_WIDGET_PATCH:
+    import functools
+    import inspect
 
-    st.button = _patched_button
+    # Patch st.button for Streamlit versions that don't support the 'type' argument (<=1.12).
+    # The script re-executes on every rerun, so skip widgets that are already wrapped.
+    # Streamlit's own decorators set __wrapped__, so our wrappers carry a private marker instead.
+    if not getattr(st.button, "_syncmaster_shim", False) and "type" not in inspect.signature(st.button).parameters:
+        _orig_button = st.button
 
-if not hasattr(st, "rerun") and hasattr(st, "experimental_rerun"):
-    st.rerun = st.experimental_rerun
+        @functools.wraps(_orig_button)
+        def _patched_button(label, *args, **kwargs):
+            kwargs.pop("type", None)
+            kwargs.pop("use_container_width", None)
+            return _orig_button(label, *args, **kwargs)
+
+        _patched_button._syncmaster_shim = True
+        st.button = _patched_button
 
-if hasattr(st, "download_button"):
-    import inspect as _dl_inspect
-    _dl_sig = _dl_inspect.signature(st.download_button)
-    if "use_container_width" not in _dl_sig.parameters:
+    if (hasattr(st, "download_button") and not getattr(st.download_button, "_syncmaster_shim", False)
+            and "use_container_width" not in inspect.signature(st.download_button).parameters):
         _orig_download_button = st.download_button
 
+        @functools.wraps(_orig_download_button)
         def _patched_download_button(label, data, *args, **kwargs):
             kwargs.pop("use_container_width", None)
             return _orig_download_button(label, data, *args, **kwargs)
 
+        _patched_download_button._syncmaster_shim = True
         st.download_button = _patched_download_button
 
 def main():
@@ -148,57 +199,82 @@ def main():
         step_3_export()
 
 def step_1_upload_and_process():
-    st.header("Step 1: Upload Your Audio File")
+    st.header("Step 1: Upload Your Audio Files")
     
-    uploaded_file = st.file_uploader(
-        "Choose an audio file",
+    uploaded_files = st.file_uploader(
+        "Choose one or more audio files",
         type=['mp3', 'wav', 'm4a'],
-        help="Supported formats: MP3, WAV, M4A"
+        accept_multiple_files=True,
+        help="Supported formats: MP3, WAV, M4A. Multiple files are processed in one batch."
     )
     
-    if uploaded_file is not None:
-        st.session_state.audio_file = uploaded_file
-        st.success(f"File uploaded: {uploaded_file.name}")
-        st.info(f"File size: {uploaded_file.size / 1024 / 1024:.2f} MB")
-        st.audio(uploaded_file)
+    if uploaded_files:
+        st.session_state.audio_files = uploaded_files
+        for uploaded_file in uploaded_files:
+            st.success(f"File uploaded: {uploaded_file.name}")
+            st.info(f"File size: {uploaded_file.size / 1024 / 1024:.2f} MB")
+            st.audio(uploaded_file)
         
         if st.button("🚀 Start AI Processing", type="primary", use_container_width=True):
             process_audio()
     
-    if st.session_state.audio_file is not None:
-        if st.button("🔄 Upload Different File"):
+    if st.session_state.audio_files:
+        if st.button("🔄 Upload Different Files"):
             reset_session()
             st.rerun()
 
 def process_audio():
+    tmp_file_paths = {}
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(st.session_state.audio_file.name).suffix) as tmp_file:
-            tmp_file.write(st.session_state.audio_file.getvalue())
-            tmp_file_path = tmp_file.name
-        processor = AUDIO_PROCESSOR_CLASS()
-        with st.spinner("🎤 Transcribing audio with AI..."):
-            transcription_result = processor.transcribe_audio(tmp_file_path)
-        if "Error:" in transcription_result or not transcription_result:
-            st.error(f"Transcription failed: {transcription_result}")
-            os.unlink(tmp_file_path)
-            return
-        word_timestamps = []
-        if hasattr(processor, 'get_word_timestamps'):
-            try:
-                with st.spinner("🔍 Extracting word timestamps..."):
-                    word_timestamps = processor.get_word_timestamps(tmp_file_path)
-                # فحص محتوى word_timestamps وعرضه للمستخدم
-                st.write("word_timestamps sample:", word_timestamps[:3])
-                if not word_timestamps:
-                    st.warning("No word timestamps extracted! SYLT embedding will not work.")
-            except Exception as e:
-                st.warning(f"Could not extract word timestamps: {e}")
+        for uploaded_file in st.session_state.audio_files:
+            # Uploads from different folders can share a name; suffix repeats so none is dropped
+            file_key = uploaded_file.name
+            suffix_number = 2
+            while file_key in tmp_file_paths:
+                file_key = f"{Path(uploaded_file.name).stem} ({suffix_number}){Path(uploaded_file.name).suffix}"
+                suffix_number += 1
+            with tempfile.NamedTemporaryFile(delete=False, dir=get_temp_dir(), prefix=get_session_prefix(),
+                                             suffix=Path(uploaded_file.name).suffix) as tmp_file:
+                # Copy in 1 MiB chunks instead of materializing the whole upload with getvalue()
+                uploaded_file.seek(0)
+                shutil.copyfileobj(uploaded_file, tmp_file, length=1024 * 1024)
+                tmp_file_paths[file_key] = tmp_file.name
+        processor = get_processor()
+        with st.spinner("🎤 Transcribing audio and extracting word timestamps with AI..."):
+            transcription_results, word_timestamp_results = asyncio.run(
+                transcribe_and_align(processor, list(tmp_file_paths.values()))
+            )
+        if isinstance(transcription_results, Exception):
+            raise transcription_results
+        transcriptions = dict(zip(tmp_file_paths, transcription_results))
+        for file_name, transcription_result in transcriptions.items():
+            if "Error:" in transcription_result or not transcription_result:
+                st.error(f"Transcription failed for {file_name}: {transcription_result}")
+                remove_tmp_files(tmp_file_paths.values())
+                return
+        word_timestamps = {file_name: [] for file_name in tmp_file_paths}
+        if isinstance(word_timestamp_results, Exception):
+            st.warning(f"Could not extract word timestamps: {word_timestamp_results}")
+        else:
+            word_timestamps = dict(zip(tmp_file_paths, word_timestamp_results))
+            # فحص محتوى word_timestamps وعرضه للمستخدم
+            for file_name, file_word_timestamps in word_timestamps.items():
+                st.write(f"{file_name} word_timestamps sample:", file_word_timestamps[:3])
+                if not file_word_timestamps:
+                    st.warning(f"No word timestamps extracted for {file_name}! SYLT embedding will not work.")
+        remove_session_files()
         st.session_state.transcription_data = {
-            'text': transcription_result,
-            'word_timestamps': word_timestamps,
-            'audio_path': tmp_file_path
+            file_name: {
+                'text': transcriptions[file_name],
+                'word_timestamps_path': store_word_timestamps(word_timestamps[file_name]),
+                'audio_path': tmp_file_path
+            }
+            for file_name, tmp_file_path in tmp_file_paths.items()
         }
-        st.session_state.edited_text = transcription_result
+        st.session_state.active_file = next(iter(tmp_file_paths))
+        # The temp files hold the audio from here on; drop the in-memory uploads
+        st.session_state.audio_files = []
+        st.session_state.edited_text = dict(transcriptions)
         st.session_state.step = 2
         st.success("🎉 Audio processing complete! Moving to customization...")
         time.sleep(1)
@@ -206,8 +282,73 @@ def process_audio():
     except Exception as e:
         st.error("An error occurred during processing!")
         st.exception(e)
-        if 'tmp_file_path' in locals() and os.path.exists(tmp_file_path):
-            os.unlink(tmp_file_path)
+        remove_tmp_files(tmp_file_paths.values())
+
+async def transcribe_and_align(processor, audio_paths):
+    """Transcribe the audio files and extract their word timestamps.
+
+    Whisper returns the words and their timings in one pass, so when it is
+    installed its words are also the transcript: the editor text, the USLT
+    frame and the SYLT frame all come from the same transcription. Gemini is
+    only asked for the files Whisper is unavailable for or found no words in,
+    and those files get timestamps estimated from the Gemini text.
+
+    Returns the list of transcriptions and the list of word timestamps; either
+    one is replaced by the exception it raised so the caller can report it.
+    """
+    word_timestamp_results = [[] for _ in audio_paths]
+    if processor.aligner.available:
+        try:
+            word_timestamp_results = await processor.get_word_timestamps_batch_async(
+                audio_paths, estimate_missing=False
+            )
+        except Exception as e:
+            print(f"Warning: Whisper alignment failed, falling back to Gemini: {e}")
+
+    missing = [i for i, file_word_timestamps in enumerate(word_timestamp_results) if not file_word_timestamps]
+    try:
+        gemini_results = await asyncio.gather(
+            *(processor.transcribe_audio_async(audio_paths[i]) for i in missing)
+        )
+    except Exception as e:
+        return [e, e]
+
+    transcription_results = [
+        ' '.join(word_data['word'] for word_data in file_word_timestamps)
+        for file_word_timestamps in word_timestamp_results
+    ]
+    for i, transcription in zip(missing, gemini_results):
+        transcription_results[i] = transcription
+
+    try:
+        await asyncio.to_thread(
+            processor.estimate_missing_word_timestamps,
+            audio_paths, word_timestamp_results, transcription_results
+        )
+    except Exception as e:
+        word_timestamp_results = e
+    return [transcription_results, word_timestamp_results]
+
+def remove_tmp_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.unlink(path)
+
+def remove_session_files():
+    """Delete the temp files referenced by the current session's transcription data."""
+    for transcription_data in (st.session_state.get('transcription_data') or {}).values():
+        remove_tmp_files([transcription_data['audio_path'], transcription_data['word_timestamps_path']])
+
+def select_active_file():
+    """Let the user pick which processed file to edit/export when several were uploaded."""
+    file_names = list(st.session_state.transcription_data)
+    if len(file_names) > 1:
+        st.session_state.active_file = st.selectbox(
+            "Active file",
+            file_names,
+            index=file_names.index(st.session_state.active_file)
+        )
+    return st.session_state.active_file
 
 def step_2_review_and_customize():
     st.header("Step 2: Review & Customize")
@@ -219,16 +360,18 @@ def step_2_review_and_customize():
             st.rerun()
         return
     
+    active_file = select_active_file()
     col1, col2 = st.columns([3, 2])
     
     with col1:
         st.subheader("📝 Text Editor")
         edited_text = st.text_area(
             "Transcribed Text",
-            value=st.session_state.edited_text,
-            height=300
+            value=st.session_state.edited_text[active_file],
+            height=300,
+            key=f"text_editor_{active_file}"
         )
-        st.session_state.edited_text = edited_text
+        st.session_state.edited_text[active_file] = edited_text
         st.caption(f"Word count: {len(edited_text.split())}")
         
     with col2:
@@ -257,6 +400,7 @@ def step_3_export():
             st.rerun()
         return
 
+    select_active_file()
     col1, col2 = st.columns(2)
     
     with col1:
@@ -284,20 +428,25 @@ def step_3_export():
 
 def export_mp3():
     """Export MP3 file and log diagnostics to the browser console and Streamlit UI."""
+    output_path = None
     try:
+        from mp3_embedder import MP3Embedder
+
         with st.spinner("Embedding lyrics into MP3..."):
             embedder = MP3Embedder()
-            word_timestamps = st.session_state.transcription_data['word_timestamps']
-            audio_path = st.session_state.transcription_data['audio_path']
-            output_filename = f"synced_{Path(st.session_state.audio_file.name).stem}.mp3"
+            active_file = st.session_state.active_file
+            transcription_data = st.session_state.transcription_data[active_file]
+            word_timestamps = load_word_timestamps(transcription_data)
+            audio_path = transcription_data['audio_path']
+            output_filename = f"synced_{Path(active_file).stem}.mp3"
             st.info("🔄 بدء عملية دمج النصوص...")
             output_path, log_messages = embedder.embed_sylt_lyrics(
                 audio_path, 
                 word_timestamps, 
-                st.session_state.edited_text,
+                st.session_state.edited_text[active_file],
                 output_filename
             )
-            log_to_browser_console(log_messages)
+            queue_browser_logs(log_messages)
             # عرض الـ logs في Streamlit
             st.subheader("📝 تفاصيل العملية:")
             for log in log_messages:
@@ -310,15 +459,23 @@ def export_mp3():
 
         st.subheader("✅ Export Complete")
         
-        if os.path.exists(output_path):
-            with open(output_path, 'rb') as audio_file:
-                audio_bytes = audio_file.read()
+        # The embedder reserves the output file up front, so an empty file means it failed
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            # Read the file once; the tag checks below parse in-memory copies,
+            # and the file itself is no longer needed
+            audio_bytes = Path(output_path).read_bytes()
+            remove_tmp_files([output_path])
             st.audio(audio_bytes, format='audio/mp3')
 
-            # --- فحص التاغات بعد الدمج مباشرة ---
             from mutagen.mp3 import MP3
-            from mutagen.id3 import ID3, SYLT, USLT
-            audio_file_obj = MP3(output_path, ID3=ID3)
+            from mutagen.id3 import ID3
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                audio_file_future = executor.submit(MP3, io.BytesIO(audio_bytes), ID3=ID3)
+                verification_future = executor.submit(embedder.verify_sylt_embedding, io.BytesIO(audio_bytes))
+                audio_file_obj = audio_file_future.result()
+                verification = verification_future.result()
+
+            # --- فحص التاغات بعد الدمج مباشرة ---
             sylt_frames = audio_file_obj.tags.getall('SYLT') if audio_file_obj.tags else []
             uslt_frames = audio_file_obj.tags.getall('USLT') if audio_file_obj.tags else []
             st.write(f"SYLT frames after export: {len(sylt_frames)}")
@@ -329,7 +486,6 @@ def export_mp3():
                 st.write("USLT frame sample:", uslt_frames[0])
             # --- نهاية الفحص ---
 
-            verification = embedder.verify_sylt_embedding(output_path)
             st.json(verification)
             if verification['has_sylt']:
                 st.success(f"Successfully embedded {verification['sylt_entries']} synchronized words!")
@@ -347,16 +503,25 @@ def export_mp3():
             
     except Exception as e:
         st.error(f"An error occurred during MP3 export: {e}")
-        log_to_browser_console([f"--- FATAL ERROR in export_mp3: {traceback.format_exc()} ---"])
+        queue_browser_logs(f"--- FATAL ERROR in export_mp3: {traceback.format_exc()} ---")
+    finally:
+        if output_path:
+            remove_tmp_files([output_path])
+        flush_browser_logs()
 
 def export_mp4():
     st.info("MP4 export functionality is not yet implemented with console logging.")
 
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def get_cached_audio_info(audio_path: str, mtime: float) -> dict:
+    """Cached get_audio_info; mtime is part of the cache key so edited files are re-read."""
+    return get_audio_info(audio_path)
+
 def get_audio_duration_seconds(audio_path: str) -> float:
     try:
-        audio_info = get_audio_info(audio_path)
+        audio_info = get_cached_audio_info(audio_path, os.path.getmtime(audio_path))
         return audio_info.get('duration', 0)
-    except:
+    except (OSError, RuntimeError):
         return 0
 
 def get_audio_duration_formatted(audio_path: str) -> str:
@@ -366,13 +531,15 @@ def get_audio_duration_formatted(audio_path: str) -> str:
     return f"{minutes}:{seconds:02d}"
 
 def reset_session():
+    remove_session_files()
     for key in list(st.session_state.keys()):
         if key not in ['step']:
             del st.session_state[key]
     st.session_state.step = 1
-    st.session_state.audio_file = None
+    st.session_state.audio_files = []
     st.session_state.transcription_data = None
-    st.session_state.edited_text = ""
+    st.session_state.active_file = None
+    st.session_state.edited_text = {}
     st.session_state.video_style = {
         'animation_style': 'Karaoke Style',
         'text_color': '#FFFFFF',
@@ -1,12 +1,177 @@
 import os
+import asyncio
+import hashlib
+import importlib.util
 from dotenv import load_dotenv
 import tempfile
-from typing import List, Dict, Optional
+import threading
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 import json
-import librosa
-import numpy as np
-from google import genai
-from google.genai import types
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from utils import CACHE_MAX_ENTRIES
+
+# google.genai, faster-whisper and the audio decoders are heavy to import, so
+# they are imported where they are first used instead of at module load
+if TYPE_CHECKING:
+    from google.genai import types
+
+# Word timestamps are stored as integer milliseconds: {'word': str, 'start': int, 'end': int}
+
+# Silero VAD (bundled with faster-whisper) runs on 16 kHz mono audio
+VAD_SAMPLE_RATE = 16000
+
+# Below this share of speech, only the speech is sent to Gemini
+VAD_MAX_SPEECH_RATIO = 0.95
+
+# Transcriptions are cached on disk by a hash of the audio content
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".syncmaster_cache")
+
+class _LRUCache:
+    """Thread-safe mapping that evicts the least recently used entry beyond maxsize"""
+    
+    def __init__(self, maxsize: int = CACHE_MAX_ENTRIES, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data
+    
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+    
+    def __setitem__(self, key, value):
+        evicted = []
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[1])
+        # Run the callback outside the lock, it may do network I/O
+        if self.on_evict:
+            for evicted_value in evicted:
+                self.on_evict(evicted_value)
+    
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+def _hash_audio_file(audio_file_path: str) -> str:
+    """Return a BLAKE2b digest of the file content, read in 1 MiB chunks"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(audio_file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class WordAligner:
+    """Extracts real word-level timestamps with faster-whisper"""
+    
+    def __init__(self, model_size: str = "small"):
+        """Store the model configuration; the model itself is loaded on first use"""
+        self.model_size = model_size
+        self._model = None
+        self._pipeline = None
+        # The aligner is shared across Streamlit sessions, so loading is serialized
+        self._load_lock = threading.Lock()
+    
+    @property
+    def available(self) -> bool:
+        """True if faster-whisper is installed"""
+        return importlib.util.find_spec("faster_whisper") is not None
+    
+    def _get_model(self):
+        """
+        Load the Whisper model on first use.
+        
+        Weights are quantized to int8 by CTranslate2 (int8_float16 on GPU);
+        set WHISPER_COMPUTE_TYPE to override, e.g. "float32".
+        """
+        with self._load_lock:
+            if self._model is None:
+                import ctranslate2
+                from faster_whisper import WhisperModel
+                device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+                default_compute_type = "int8_float16" if device == "cuda" else "int8"
+                compute_type = os.getenv("WHISPER_COMPUTE_TYPE", default_compute_type)
+                self._model = WhisperModel(self.model_size, device=device, compute_type=compute_type)
+            return self._model
+    
+    def _get_pipeline(self):
+        """Wrap the loaded model in a batched inference pipeline on first use"""
+        model = self._get_model()
+        with self._load_lock:
+            if self._pipeline is None:
+                from faster_whisper import BatchedInferencePipeline
+                self._pipeline = BatchedInferencePipeline(model=model)
+            return self._pipeline
+    
+    @staticmethod
+    def _flatten_words(segments) -> List[Dict]:
+        """Flatten Whisper segments into a list of word timestamp dictionaries (milliseconds)"""
+        return [
+            {'word': w.word.strip(), 'start': int(w.start * 1000 + 0.5), 'end': int(w.end * 1000 + 0.5)}
+            for segment in segments
+            for w in (segment.words or [])
+            if w.word.strip()
+        ]
+    
+    def align(self, audio_file_path: str) -> List[Dict]:
+        """
+        Transcribe the audio and return the timing of every recognized word
+        
+        Args:
+            audio_file_path: Path to the audio file
+            
+        Returns:
+            List of dictionaries with word, start, and end timestamps in milliseconds
+        """
+        segments, _ = self._get_model().transcribe(
+            audio_file_path,
+            word_timestamps=True,
+            vad_filter=True
+        )
+        return self._flatten_words(segments)
+    
+    def align_batch(self, audio_file_paths: List[str], batch_size: int = 16) -> List[List[Dict]]:
+        """
+        Align several audio files through one shared batched pipeline.
+        
+        The VAD speech chunks of each file are decoded `batch_size` at a time,
+        so the model stays busy instead of decoding one window per call.
+        
+        Args:
+            audio_file_paths: Paths to the audio files
+            batch_size: Number of speech chunks decoded per forward pass
+            
+        Returns:
+            One list of word timestamp dictionaries (milliseconds) per input
+            file; empty for files that could not be aligned
+        """
+        pipeline = self._get_pipeline()
+        results = []
+        for audio_file_path in audio_file_paths:
+            # One bad file must not discard the timings of the rest of the batch
+            try:
+                segments, _ = pipeline.transcribe(
+                    audio_file_path,
+                    batch_size=batch_size,
+                    word_timestamps=True,
+                    vad_filter=True
+                )
+                results.append(self._flatten_words(segments))
+            except Exception as e:
+                print(f"Warning: Whisper alignment failed for {os.path.basename(audio_file_path)}: {str(e)}")
+                results.append([])
+        return results
 
 class AudioProcessor:
     """Handles audio transcription and word-level timestamp extraction using Gemini AI"""
@@ -14,11 +179,19 @@ class AudioProcessor:
     def __init__(self):
         """Initialize the audio processor with Gemini client"""
         self.client = None
+        self.aligner = WordAligner()
+        # Keyed by audio content hash; values are text, Files API handles and
+        # (start, end) speech regions in milliseconds
+        self._transcription_cache = _LRUCache()
+        self._uploaded_files = _LRUCache(on_evict=self._delete_uploaded_file)
+        self._speech_regions = _LRUCache()
         self._initialize_gemini()
     
     def _initialize_gemini(self):
         """Initialize the Gemini client"""
         try:
+            from google import genai
+            
             # Load environment variables from a .env file if present
             load_dotenv()
 
@@ -51,9 +224,11 @@ class AudioProcessor:
                 # Fallback to sample text if Gemini is not available
                 return "Please edit this text to match your audio content. Gemini transcription is not available."
             
-            # Read audio file as bytes
-            with open(audio_file_path, 'rb') as f:
-                audio_bytes = f.read()
+            # Reuse a previous transcription of identical audio
+            audio_hash = _hash_audio_file(audio_file_path)
+            cached_text = self._get_cached_transcription(audio_hash)
+            if cached_text:
+                return cached_text
             
             # Determine MIME type based on file extension
             file_ext = os.path.splitext(audio_file_path)[1].lower()
@@ -66,20 +241,34 @@ class AudioProcessor:
             }
             mime_type = mime_type_map.get(file_ext, 'audio/mpeg')
             
-            # Transcribe with Gemini
+            # A live upload of the same audio skips VAD and the upload entirely
+            audio_file = self._get_uploaded_file(audio_hash)
+            if audio_file is None:
+                # Send only the speech regions when the audio contains enough silence
+                speech_file_path = self._write_speech_only_audio(audio_file_path, audio_hash)
+                try:
+                    # Upload the file from disk and transcribe it with Gemini
+                    if speech_file_path:
+                        audio_file = self._upload_audio(speech_file_path, audio_hash, 'audio/flac')
+                    else:
+                        audio_file = self._upload_audio(audio_file_path, audio_hash, mime_type)
+                finally:
+                    if speech_file_path:
+                        os.unlink(speech_file_path)
             response = self.client.models.generate_content(
                 model="gemini-2.5-flash",
                 contents=[
-                    types.Part.from_bytes(
-                        data=audio_bytes,
-                        mime_type=mime_type,
-                    ),
+                    audio_file,
                     "Please transcribe this audio file accurately. Provide only the spoken text without any additional commentary, formatting, or explanations. Just return the pure transcribed text."
                 ],
             )
             
             if response and response.text:
-                return response.text.strip()
+                text = response.text.strip()
+                self._store_cached_transcription(audio_hash, text)
+                # The cached text replaces the upload, so free it on the server
+                self._delete_uploaded_file(self._uploaded_files.pop(audio_hash))
+                return text
             else:
                 return "Please edit this text to match your audio content. Transcription failed."
                 
@@ -87,76 +276,421 @@ class AudioProcessor:
             print(f"Error transcribing audio: {str(e)}")
             return "Please edit this text to match your audio content. An error occurred during transcription."
     
-    def get_word_timestamps(self, audio_file_path: str) -> List[Dict]:
+    def _upload_audio(self, audio_file_path: str, audio_hash: str, mime_type: str) -> "types.File":
+        """
+        Upload an audio file through the Gemini Files API.
+        
+        The upload streams from disk instead of inlining base64 data in the
+        request. Handles are reused per content hash until they expire, are
+        evicted or their transcription has been cached.
+        
+        Args:
+            audio_file_path: Path to the audio file
+            audio_hash: Content hash of the audio file
+            mime_type: MIME type of the audio file
+            
+        Returns:
+            Handle of the uploaded file
+        """
+        from google.genai import types
+        
+        audio_file = self._get_uploaded_file(audio_hash)
+        if audio_file is not None:
+            return audio_file
+        
+        audio_file = self.client.files.upload(
+            file=audio_file_path,
+            config=types.UploadFileConfig(mime_type=mime_type)
+        )
+        self._uploaded_files[audio_hash] = audio_file
+        return audio_file
+    
+    def _get_uploaded_file(self, audio_hash: str) -> Optional["types.File"]:
+        """
+        Return the uploaded file handle for an audio hash, dropping it if it has expired
+        
+        Args:
+            audio_hash: Content hash of the audio file
+            
+        Returns:
+            Handle of the uploaded file, or None if there is no live upload
+        """
+        audio_file = self._uploaded_files.get(audio_hash)
+        if audio_file is None:
+            return None
+        if audio_file.expiration_time is not None and audio_file.expiration_time <= datetime.now(timezone.utc):
+            self._uploaded_files.pop(audio_hash)
+            return None
+        return audio_file
+    
+    def _delete_uploaded_file(self, audio_file: Optional["types.File"]):
+        """
+        Delete an uploaded file from the Gemini Files API
+        
+        Args:
+            audio_file: Handle of the uploaded file, or None
+        """
+        if audio_file is None or not self.client:
+            return
+        try:
+            self.client.files.delete(name=audio_file.name)
+        except Exception as e:
+            print(f"Warning: Failed to delete uploaded file {audio_file.name}: {str(e)}")
+    
+    def _detect_speech(self, audio_file_path: str, audio_hash: str):
         """
-        Create word-level timestamps from transcribed text and audio duration
+        Find the speech regions of an audio file with Silero VAD
         
         Args:
             audio_file_path: Path to the audio file
+            audio_hash: Content hash of the audio file
             
         Returns:
-            List of dictionaries with word, start, and end timestamps
+            Tuple of the decoded 16 kHz samples and the Silero speech
+            timestamps (sample offsets), or (None, None) if VAD is unavailable.
+            The regions are also cached in milliseconds for the estimator.
+        """
+        if not self.aligner.available:
+            return None, None
+        
+        try:
+            from faster_whisper.audio import decode_audio
+            from faster_whisper.vad import get_speech_timestamps
+            
+            audio = decode_audio(audio_file_path, sampling_rate=VAD_SAMPLE_RATE)
+            speech_timestamps = get_speech_timestamps(audio, sampling_rate=VAD_SAMPLE_RATE)
+        except Exception as e:
+            print(f"Warning: Voice activity detection failed: {str(e)}")
+            return None, None
+        
+        speech_regions = [
+            (ts['start'] * 1000 // VAD_SAMPLE_RATE, ts['end'] * 1000 // VAD_SAMPLE_RATE)
+            for ts in speech_timestamps
+        ]
+        self._speech_regions[audio_hash] = speech_regions
+        return audio, speech_timestamps
+    
+    def _get_speech_regions(self, audio_file_path: str) -> Optional[List[Tuple[int, int]]]:
+        """
+        Get the speech regions of an audio file, running VAD if needed
+        
+        Args:
+            audio_file_path: Path to the audio file
+            
+        Returns:
+            List of (start, end) speech regions in milliseconds, or None if VAD is unavailable
+        """
+        audio_hash = _hash_audio_file(audio_file_path)
+        if audio_hash not in self._speech_regions:
+            self._detect_speech(audio_file_path, audio_hash)
+        return self._speech_regions.get(audio_hash)
+    
+    def _write_speech_only_audio(self, audio_file_path: str, audio_hash: str) -> Optional[str]:
+        """
+        Write the speech regions of an audio file to a temporary 16 kHz FLAC
+        file, so silence is not uploaded and billed
+        
+        Args:
+            audio_file_path: Path to the audio file
+            audio_hash: Content hash of the audio file
+            
+        Returns:
+            Path to the temporary FLAC file, or None if the original file
+            should be sent as is
+        """
+        audio, speech_timestamps = self._detect_speech(audio_file_path, audio_hash)
+        if not speech_timestamps:
+            return None
+        
+        speech_samples = sum(ts['end'] - ts['start'] for ts in speech_timestamps)
+        if speech_samples >= VAD_MAX_SPEECH_RATIO * len(audio):
+            return None
+        
+        try:
+            import numpy as np
+            import soundfile as sf
+            
+            speech_audio = np.concatenate([audio[ts['start']:ts['end']] for ts in speech_timestamps])
+            # Lossless but much smaller on the wire than 256 kbps PCM16 WAV
+            with tempfile.NamedTemporaryFile(suffix='.flac', delete=False) as tmp_file:
+                sf.write(tmp_file, speech_audio, VAD_SAMPLE_RATE, format='FLAC')
+            return tmp_file.name
+        except Exception as e:
+            print(f"Warning: Failed to write speech-only audio: {str(e)}")
+            return None
+    
+    def _get_cached_transcription(self, audio_hash: str) -> Optional[str]:
+        """
+        Look up a transcription in the in-memory cache, then on disk
+        
+        Args:
+            audio_hash: Content hash of the audio file
+            
+        Returns:
+            Cached transcription or None if not cached
+        """
+        text = self._transcription_cache.get(audio_hash)
+        if text is not None:
+            return text
+        
+        try:
+            with open(os.path.join(CACHE_DIR, f"{audio_hash}.json"), 'r', encoding='utf-8') as f:
+                text = json.load(f)['text']
+        except (OSError, ValueError, KeyError):
+            return None
+        
+        self._transcription_cache[audio_hash] = text
+        return text
+    
+    def _store_cached_transcription(self, audio_hash: str, text: str):
+        """
+        Save a transcription in memory and on disk
+        
+        Args:
+            audio_hash: Content hash of the audio file
+            text: Transcribed text
+        """
+        self._transcription_cache[audio_hash] = text
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # Write to a temporary file first so readers never see a partial entry
+            with tempfile.NamedTemporaryFile('w', dir=CACHE_DIR, suffix='.tmp', delete=False, encoding='utf-8') as f:
+                json.dump({'text': text}, f)
+            os.replace(f.name, os.path.join(CACHE_DIR, f"{audio_hash}.json"))
+        except OSError as e:
+            print(f"Warning: Failed to write transcription cache: {str(e)}")
+    
+    async def transcribe_audio_async(self, audio_file_path: str) -> Optional[str]:
+        """
+        Transcribe audio without blocking the caller's event loop
+        
+        Args:
+            audio_file_path: Path to the audio file
+            
+        Returns:
+            Transcribed text or None if failed
+        """
+        return await asyncio.to_thread(self.transcribe_audio, audio_file_path)
+    
+    def get_word_timestamps(self, audio_file_path: str, transcription: Optional[str] = None) -> List[Dict]:
+        """
+        Create word-level timestamps for the audio file.
+        
+        Uses the faster-whisper aligner when it is installed; otherwise the
+        Gemini transcription is spread evenly across the audio duration.
+        
+        Args:
+            audio_file_path: Path to the audio file
+            transcription: Already transcribed text; transcribed on demand if None
+            
+        Returns:
+            List of dictionaries with word, start, and end timestamps in milliseconds
         """
         try:
             if not os.path.exists(audio_file_path):
                 raise FileNotFoundError(f"Audio file not found: {audio_file_path}")
             
-            # First get the transcription
-            transcription = self.transcribe_audio(audio_file_path)
-            if not transcription:
-                return []
-            
-            # Get audio duration
-            audio_duration = self.get_audio_duration(audio_file_path)
-            if audio_duration <= 0:
-                return []
-            
-            # Split transcription into words
-            words = transcription.split()
-            if not words:
-                return []
-            
-            # Calculate timing for each word
-            word_timestamps = []
-            total_words = len(words)
-            
-            for i, word in enumerate(words):
-                # Distribute words evenly across the audio duration
-                # Leave some silence at the beginning and end
-                start_offset = 0.5  # 0.5 seconds at start
-                end_offset = 0.5    # 0.5 seconds at end
-                usable_duration = audio_duration - start_offset - end_offset
-                
-                if total_words == 1:
-                    start_time = start_offset
-                    end_time = audio_duration - end_offset
-                else:
-                    # Calculate word timing
-                    word_duration = usable_duration / total_words
-                    start_time = start_offset + (i * word_duration)
-                    end_time = start_offset + ((i + 1) * word_duration)
-                
-                # Add some variation to make it more natural
-                if i > 0:
-                    # Small gap between words
-                    start_time += 0.05
-                
-                word_data = {
-                    'word': word.strip(),
-                    'start': round(start_time, 3),
-                    'end': round(end_time, 3)
-                }
-                word_timestamps.append(word_data)
+            if self.aligner.available:
+                try:
+                    word_timestamps = self.aligner.align(audio_file_path)
+                    if word_timestamps:
+                        return word_timestamps
+                except Exception as e:
+                    print(f"Warning: Whisper alignment failed, estimating timestamps instead: {str(e)}")
             
-            return word_timestamps
+            return self._estimate_word_timestamps(audio_file_path, transcription)
             
         except Exception as e:
             print(f"Error creating word timestamps: {str(e)}")
             return []
     
+    def get_word_timestamps_batch(self, audio_file_paths: List[str],
+                                  transcriptions: Optional[List[str]] = None,
+                                  estimate_missing: bool = True) -> List[List[Dict]]:
+        """
+        Create word-level timestamps for several audio files in one batch
+        
+        Args:
+            audio_file_paths: Paths to the audio files
+            transcriptions: Already transcribed text per file; transcribed on demand if None
+            estimate_missing: Estimate timestamps for files Whisper produced no
+                words for. Pass False when the transcriptions are still being
+                produced elsewhere, and call estimate_missing_word_timestamps
+                once they are available.
+            
+        Returns:
+            One list of word timestamp dictionaries (milliseconds) per input file
+        """
+        results = [[] for _ in audio_file_paths]
+        
+        if self.aligner.available:
+            try:
+                results = self.aligner.align_batch(audio_file_paths)
+            except Exception as e:
+                print(f"Warning: Batched Whisper alignment failed, estimating timestamps instead: {str(e)}")
+        
+        if estimate_missing:
+            self.estimate_missing_word_timestamps(audio_file_paths, results, transcriptions)
+        return results
+    
+    def estimate_missing_word_timestamps(self, audio_file_paths: List[str], results: List[List[Dict]],
+                                         transcriptions: Optional[List[str]] = None) -> List[List[Dict]]:
+        """
+        Fill in estimated word timestamps for the files that have none
+        
+        Args:
+            audio_file_paths: Paths to the audio files
+            results: Word timestamps per file; empty entries are filled in place
+            transcriptions: Already transcribed text per file; transcribed on demand if None
+            
+        Returns:
+            The updated results
+        """
+        for i, audio_file_path in enumerate(audio_file_paths):
+            if not results[i]:
+                try:
+                    transcription = transcriptions[i] if transcriptions else None
+                    results[i] = self._estimate_word_timestamps(audio_file_path, transcription)
+                except Exception as e:
+                    print(f"Error creating word timestamps: {str(e)}")
+        
+        return results
+    
+    async def get_word_timestamps_batch_async(self, audio_file_paths: List[str],
+                                              transcriptions: Optional[List[str]] = None,
+                                              estimate_missing: bool = True) -> List[List[Dict]]:
+        """
+        Create word-level timestamps for several files without blocking the
+        caller's event loop
+        
+        Args:
+            audio_file_paths: Paths to the audio files
+            transcriptions: Already transcribed text per file; transcribed on demand if None
+            estimate_missing: See get_word_timestamps_batch
+            
+        Returns:
+            One list of word timestamp dictionaries (milliseconds) per input file
+        """
+        return await asyncio.to_thread(
+            self.get_word_timestamps_batch, audio_file_paths, transcriptions, estimate_missing
+        )
+    
+    def _estimate_word_timestamps(self, audio_file_path: str, transcription: Optional[str] = None) -> List[Dict]:
+        """
+        Estimate word timestamps by spreading the Gemini transcription evenly
+        across the detected speech, or across the whole audio duration when
+        no speech regions are known
+        
+        Args:
+            audio_file_path: Path to the audio file
+            transcription: Already transcribed text; transcribed on demand if None
+            
+        Returns:
+            List of dictionaries with word, start, and end timestamps in milliseconds
+        """
+        if transcription is None:
+            transcription = self.transcribe_audio(audio_file_path)
+        if not transcription:
+            return []
+        
+        # Split transcription into words
+        words = transcription.split()
+        if not words:
+            return []
+        
+        speech_regions = self._get_speech_regions(audio_file_path)
+        if speech_regions:
+            return self._spread_words_over_speech(words, speech_regions)
+        
+        # Get audio duration
+        audio_duration = self.get_audio_duration(audio_file_path)
+        if audio_duration <= 0:
+            return []
+        
+        # Distribute words evenly across the audio duration
+        # Leave some silence at the beginning and end
+        start_offset = 0.5  # 0.5 seconds at start
+        end_offset = 0.5    # 0.5 seconds at end
+        total_words = len(words)
+        
+        if total_words == 1:
+            return [{
+                'word': words[0].strip(),
+                'start': int(start_offset * 1000),
+                'end': int((audio_duration - end_offset) * 1000 + 0.5)
+            }]
+        
+        import numpy as np
+        
+        # Calculate the timing of all words at once
+        word_duration = (audio_duration - start_offset - end_offset) / total_words
+        indices = np.arange(total_words)
+        starts = start_offset + indices * word_duration
+        ends = starts + word_duration
+        # Small gap between words to make it more natural
+        starts[1:] += 0.05
+        
+        starts_ms = np.rint(starts * 1000).astype(np.int64)
+        ends_ms = np.rint(ends * 1000).astype(np.int64)
+        
+        return [
+            {'word': word.strip(), 'start': start, 'end': end}
+            for word, start, end in zip(words, starts_ms.tolist(), ends_ms.tolist())
+        ]
+    
+    def _spread_words_over_speech(self, words: List[str], speech_regions: List[Tuple[int, int]]) -> List[Dict]:
+        """
+        Distribute words evenly over the speech regions, skipping the silence
+        between them
+        
+        Args:
+            words: Transcribed words
+            speech_regions: List of (start, end) speech regions in milliseconds
+            
+        Returns:
+            List of dictionaries with word, start, and end timestamps in milliseconds
+        """
+        total_words = len(words)
+        if total_words == 1:
+            return [{'word': words[0].strip(), 'start': speech_regions[0][0], 'end': speech_regions[-1][1]}]
+        
+        import numpy as np
+        
+        # Position of every region on a timeline that contains only speech
+        regions = np.asarray(speech_regions, dtype=np.float64)
+        region_lengths = regions[:, 1] - regions[:, 0]
+        speech_ends = np.cumsum(region_lengths)
+        speech_starts = speech_ends - region_lengths
+        last_region = len(regions) - 1
+        
+        # Lay the words out evenly on the speech timeline...
+        word_duration = speech_ends[-1] / total_words
+        speech_word_starts = np.arange(total_words) * word_duration
+        speech_word_ends = speech_word_starts + word_duration
+        
+        # ...then map each position back into its region of the real audio
+        region = np.minimum(np.searchsorted(speech_ends, speech_word_starts, side='right'), last_region)
+        starts = regions[region, 0] + speech_word_starts - speech_starts[region]
+        region = np.minimum(np.searchsorted(speech_ends, speech_word_ends, side='left'), last_region)
+        ends = regions[region, 0] + speech_word_ends - speech_starts[region]
+        # Small gap between words to make it more natural
+        starts[1:] += 50
+        
+        return [
+            {'word': word.strip(), 'start': start, 'end': end}
+            for word, start, end in zip(
+                words,
+                np.rint(starts).astype(np.int64).tolist(),
+                np.rint(ends).astype(np.int64).tolist()
+            )
+        ]
+    
     def get_audio_duration(self, audio_file_path: str) -> float:
         """
-        Get the duration of the audio file in seconds
+        Get the duration of the audio file in seconds.
+        
+        Reads the container header with soundfile or mutagen; the file is only
+        decoded with librosa if neither can parse it.
         
         Args:
             audio_file_path: Path to the audio file
@@ -165,7 +699,22 @@ class AudioProcessor:
             Duration in seconds
         """
         try:
-            audio_data, sample_rate = librosa.load(audio_file_path)
+            import soundfile as sf
+            return sf.info(audio_file_path).duration
+        except Exception:
+            pass
+        
+        try:
+            import mutagen
+            audio_file = mutagen.File(audio_file_path)
+            if audio_file is not None and audio_file.info.length > 0:
+                return audio_file.info.length
+        except Exception:
+            pass
+        
+        try:
+            import librosa
+            audio_data, sample_rate = librosa.load(audio_file_path, sr=None)
             duration = len(audio_data) / sample_rate
             return duration
         except Exception as e:
@@ -177,77 +726,76 @@ class AudioProcessor:
         Validate and clean word timestamps
         
         Args:
-            word_timestamps: List of word timestamp dictionaries
+            word_timestamps: List of word timestamp dictionaries (milliseconds)
             audio_duration: Total duration of audio in seconds
             
         Returns:
-            Cleaned list of word timestamps
+            Cleaned list of word timestamps in milliseconds
         """
-        cleaned_timestamps = []
+        if not word_timestamps:
+            return []
         
-        for word_data in word_timestamps:
-            # Ensure start and end times are valid
-            start_time = max(0, word_data.get('start', 0))
-            end_time = min(audio_duration, word_data.get('end', start_time + 0.1))
-            
-            # Ensure end time is after start time
-            if end_time <= start_time:
-                end_time = start_time + 0.1
-            
-            cleaned_word = {
-                'word': word_data.get('word', '').strip(),
-                'start': round(start_time, 3),
-                'end': round(end_time, 3)
-            }
-            
-            if cleaned_word['word']:
-                cleaned_timestamps.append(cleaned_word)
+        import numpy as np
         
-        return cleaned_timestamps
+        total_words = len(word_timestamps)
+        audio_duration_ms = int(audio_duration * 1000 + 0.5)
+        words = [w.get('word', '').strip() for w in word_timestamps]
+        starts = np.fromiter((w.get('start', 0) for w in word_timestamps), dtype=np.float64, count=total_words)
+        # Missing end times become NaN here and start + 100 ms below
+        ends = np.fromiter((w.get('end', np.nan) for w in word_timestamps), dtype=np.float64, count=total_words)
+        
+        # Ensure start and end times are valid
+        np.maximum(starts, 0, out=starts)
+        missing = np.isnan(ends)
+        ends[missing] = starts[missing] + 100
+        np.minimum(ends, audio_duration_ms, out=ends)
+        
+        # Ensure end time is after start time
+        too_short = ends <= starts
+        ends[too_short] = starts[too_short] + 100
+        
+        return [
+            {'word': word, 'start': start, 'end': end}
+            for word, start, end in zip(
+                words,
+                np.rint(starts).astype(np.int64).tolist(),
+                np.rint(ends).astype(np.int64).tolist()
+            )
+            if word
+        ]
     
     def create_sentence_timestamps(self, word_timestamps: List[Dict], max_words_per_line: int = 8) -> List[Dict]:
         """
         Group words into sentences/lines for better video display
         
         Args:
-            word_timestamps: List of word timestamp dictionaries
+            word_timestamps: List of word timestamp dictionaries (milliseconds)
             max_words_per_line: Maximum words per line
             
         Returns:
-            List of sentence/line dictionaries with timestamps
+            List of sentence/line dictionaries with timestamps in milliseconds
         """
         if not word_timestamps:
             return []
         
+        # Read each word once; sentences are sliced out of the input by index
+        words = [w.get('word', '') for w in word_timestamps]
         sentences = []
-        current_sentence = []
+        sentence_start = 0
+        total_words = len(words)
         
-        for word_data in word_timestamps:
-            current_sentence.append(word_data)
+        for i, word in enumerate(words):
+            sentence_end = i + 1
             
-            # Check if we should end this sentence
-            word = word_data.get('word', '')
-            if (len(current_sentence) >= max_words_per_line or 
-                word.endswith('.') or word.endswith('!') or word.endswith('?')):
-                
-                if current_sentence:
-                    sentence_data = {
-                        'text': ' '.join([w.get('word', '') for w in current_sentence]).strip(),
-                        'start': current_sentence[0].get('start', 0),
-                        'end': current_sentence[-1].get('end', 0),
-                        'words': current_sentence.copy()
-                    }
-                    sentences.append(sentence_data)
-                    current_sentence = []
-        
-        # Add remaining words as final sentence
-        if current_sentence:
-            sentence_data = {
-                'text': ' '.join([w.get('word', '') for w in current_sentence]).strip(),
-                'start': current_sentence[0].get('start', 0),
-                'end': current_sentence[-1].get('end', 0),
-                'words': current_sentence.copy()
-            }
-            sentences.append(sentence_data)
+            # End the sentence when it is full, on sentence punctuation, or at the last word
+            if (sentence_end - sentence_start >= max_words_per_line or
+                    word.endswith(('.', '!', '?')) or sentence_end == total_words):
+                sentences.append({
+                    'text': ' '.join(words[sentence_start:sentence_end]).strip(),
+                    'start': word_timestamps[sentence_start].get('start', 0),
+                    'end': word_timestamps[i].get('end', 0),
+                    'words': word_timestamps[sentence_start:sentence_end]
+                })
+                sentence_start = sentence_end
         
         return sentences
@@ -1,23 +1,101 @@
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, SYLT, USLT, Encoding
+from mutagen.id3 import ID3, ID3NoHeaderError, SYLT, USLT, Encoding
+import functools
+import io
+import logging
+import multiprocessing
 import os
-import tempfile
 import shutil
 import subprocess
-from typing import List, Dict, Tuple
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+
+from utils import get_temp_dir, reserve_temp_file
+
+logger = logging.getLogger(__name__)
 
 # --- Helper function to check for ffmpeg ---
+@functools.lru_cache(maxsize=1)
 def is_ffmpeg_available():
     """Check if ffmpeg is installed and accessible in the system's PATH."""
     return shutil.which("ffmpeg") is not None
 
+def _fast_copy(src: str, dst: str) -> None:
+    """
+    Copy a file without bouncing its contents through Python buffers.
+    
+    Tries copy_file_range (a reflink on CoW filesystems, an in-kernel copy
+    elsewhere), then sendfile, then a plain buffered copy. File metadata is
+    copied afterwards, like shutil.copy2.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(in_fd).st_size
+        try:
+            copied = 0
+            while copied < size:
+                sent = os.copy_file_range(in_fd, out_fd, size - copied, copied, copied)
+                if sent == 0:
+                    break
+                copied += sent
+        except (AttributeError, OSError):
+            # Start over from the beginning in case a partial copy happened
+            os.lseek(out_fd, 0, os.SEEK_SET)
+            os.ftruncate(out_fd, 0)
+            try:
+                copied = 0
+                while copied < size:
+                    sent = os.sendfile(out_fd, in_fd, copied, size - copied)
+                    if sent == 0:
+                        break
+                    copied += sent
+            except (AttributeError, OSError):
+                os.lseek(out_fd, 0, os.SEEK_SET)
+                os.ftruncate(out_fd, 0)
+                fsrc.seek(0)
+                shutil.copyfileobj(fsrc, fdst, length=1 << 20)
+    shutil.copystat(src, dst)
+
+@functools.lru_cache(maxsize=128)
+def _probe_audio_codec(audio_path: str, mtime: float) -> Optional[str]:
+    """
+    Return the codec name of the file's first audio stream, or None if unknown.
+    
+    The modification time is only part of the cache key, so an edited file
+    is probed again.
+    """
+    try:
+        output = subprocess.check_output(
+            ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
+             '-show_entries', 'stream=codec_name', '-of', 'csv=p=0', audio_path],
+            stderr=subprocess.DEVNULL
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('utf-8', errors='replace').strip() or None
+
+_sylt_pool = None
+_sylt_pool_lock = threading.Lock()
+
+def _get_sylt_pool() -> ThreadPoolExecutor:
+    """
+    Return the thread pool used to build SYLT data while ffmpeg runs.
+    
+    Created lazily, so each worker process of embed_batch builds its own.
+    """
+    global _sylt_pool
+    with _sylt_pool_lock:
+        if _sylt_pool is None:
+            _sylt_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='sylt')
+        return _sylt_pool
+
 class MP3Embedder:
     """Handles embedding SYLT synchronized lyrics into MP3 files with robust error handling."""
     
     def __init__(self):
         """Initialize the MP3 embedder."""
-        self.temp_dir = "/tmp/audio_sync"
-        os.makedirs(self.temp_dir, exist_ok=True)
+        self.temp_dir = get_temp_dir()
 
         self.ffmpeg_available = is_ffmpeg_available()
 
@@ -31,111 +109,94 @@ class MP3Embedder:
             - The path to the output MP3 file.
             - A list of log messages detailing the process.
         """
-        log_messages = []
-        def log_and_print(message):
-            log_messages.append(message)
-            print(f"MP3_EMBEDDER: {message}")
-        log_and_print(f"--- MP3Embedder initialized. ffmpeg available: {self.ffmpeg_available} ---")
-        log_and_print(f"--- Starting SYLT embedding for: {os.path.basename(audio_path)} ---")
-        output_path = os.path.join(self.temp_dir, output_filename)
-        try:
-            # --- Step 1: Ensure the file is in MP3 format ---
-            if not audio_path.lower().endswith('.mp3'):
-                if self.ffmpeg_available:
-                    log_and_print(f"'{os.path.basename(audio_path)}' is not an MP3. Converting with ffmpeg...")
-                    try:
-                        subprocess.run(
-                            ['ffmpeg', '-i', audio_path, '-codec:a', 'libmp3lame', '-q:a', '2', output_path],
-                            check=True, capture_output=True, text=True
-                        )
-                        log_and_print("--- ffmpeg conversion successful. ---")
-                    except subprocess.CalledProcessError as e:
-                        log_and_print("--- ERROR: ffmpeg conversion failed. ---")
-                        log_and_print(f"--- ffmpeg stderr: {e.stderr} ---")
-                        log_and_print("--- Fallback: Copying original file without conversion. ---")
-                        shutil.copy2(audio_path, output_path)
-                else:
-                    log_and_print("--- WARNING: ffmpeg is not available. Cannot convert non-MP3 file. Copying directly. ---")
-                    shutil.copy2(audio_path, output_path)
-            else:
-                log_and_print("--- Audio is already MP3. Copying to temporary location. ---")
-                shutil.copy2(audio_path, output_path)
-
-            # --- Step 2: Create SYLT data ---
-            log_and_print("--- Creating SYLT data from timestamps... ---")
-            sylt_data = self._create_sylt_data(word_timestamps)
-            if not sylt_data:
-                log_and_print("--- WARNING: No SYLT data could be created. Skipping embedding. ---")
-                return output_path, log_messages
-
-            log_and_print(f"--- Created {len(sylt_data)} SYLT entries. ---")
+        output_path = reserve_temp_file(output_filename)
+        return _embed_one((audio_path, word_timestamps, text, output_path, self.ffmpeg_available))
 
-            # --- Step 3: Embed data into the MP3 file ---
-            try:
-                log_and_print("--- Loading MP3 file with mutagen... ---")
-                audio_file = MP3(output_path, ID3=ID3)
-                
-                if audio_file.tags is None:
-                    log_and_print("--- No ID3 tags found. Creating new ones. ---")
-                    audio_file.add_tags()
-
-                # --- Embed SYLT (Synchronized Lyrics) ---
-                log_and_print("--- Creating and adding SYLT frame... ---")
-                sylt_frame = SYLT(
-                    encoding=Encoding.UTF8,
-                    lang='eng',
-                    format=2,
-                    type=1,
-                    text=sylt_data
-                )
-                audio_file.tags.delall('SYLT')
-                audio_file.tags.add(sylt_frame)
-
-                # --- Embed USLT (Unsynchronized Lyrics) as a fallback ---
-                log_and_print("--- Creating and adding USLT frame... ---")
-                uslt_frame = USLT(
-                    encoding=Encoding.UTF8,
-                    lang='eng',
-                    desc='',
-                    text=text
-                )
-                audio_file.tags.delall('USLT')
-                audio_file.tags.add(uslt_frame)
+    def embed_batch(self, jobs: List[Tuple[str, List[Dict], str, str]]) -> List[Tuple[str, List[str]]]:
+        """
+        Embed lyrics into several files at once, one worker process per file
+        
+        Args:
+            jobs: List of (audio_path, word_timestamps, text, output_filename) tuples
+            
+        Returns:
+            List of (output_path, log_messages) tuples, in the same order as jobs
+        """
+        if not jobs:
+            return []
+        
+        args = [
+            (audio_path, word_timestamps, text, reserve_temp_file(output_filename), self.ffmpeg_available)
+            for audio_path, word_timestamps, text, output_filename in jobs
+        ]
+        if len(args) == 1:
+            return [_embed_one(args[0])]
+        
+        # Spawn fresh workers: forking the multi-threaded Streamlit server can
+        # copy locks held by other threads and deadlock the child
+        max_workers = min(os.cpu_count() or 1, len(args))
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            return list(executor.map(_embed_one, args, chunksize=1))
 
-                audio_file.save()
-                log_and_print("--- Successfully embedded SYLT and USLT frames. ---")
-                
-            except Exception as e:
-                log_and_print(f"--- ERROR: Failed to embed SYLT/USLT: {e} ---")
-            return output_path, log_messages
+    @staticmethod
+    def _convert_to_mp3(audio_path: str, output_path: str) -> Tuple[bool, str]:
+        """
+        Convert an audio file to MP3 with ffmpeg
+        
+        ffmpeg writes straight to output_path: its MP3 muxer only emits the
+        Xing/LAME header (frame count and seek table for VBR) when the output
+        is seekable, so the result must not go through a pipe.
+        
+        Audio that is already MP3-encoded (e.g. inside another container) is
+        remuxed with a stream copy instead of being re-encoded.
+        
+        Args:
+            audio_path: Path to the source audio file
+            output_path: Path for the converted MP3 file
+            
+        Returns:
+            A tuple of whether the conversion succeeded and ffmpeg's stderr output
+        """
+        if _probe_audio_codec(audio_path, os.path.getmtime(audio_path)) == 'mp3':
+            converted, ffmpeg_error = MP3Embedder._run_ffmpeg(audio_path, output_path, ['-c:a', 'copy'])
+            if converted:
+                return converted, ffmpeg_error
+        
+        return MP3Embedder._run_ffmpeg(audio_path, output_path, ['-codec:a', 'libmp3lame', '-q:a', '2'])
 
-        except Exception as e:
-            log_and_print(f"--- ERROR: Unexpected error in embed_sylt_lyrics: {e} ---")
-            return output_path, log_messages
+    @staticmethod
+    def _run_ffmpeg(audio_path: str, output_path: str, codec_args: List[str]) -> Tuple[bool, str]:
+        """Run ffmpeg with the given audio codec arguments, writing MP3 to output_path."""
+        result = subprocess.run(
+            ['ffmpeg', '-y', '-i', audio_path, '-f', 'mp3', *codec_args, output_path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        if result.returncode != 0:
+            return False, result.stderr.decode('utf-8', errors='replace')
+        return True, ''
 
-    def _create_sylt_data(self, word_timestamps: List[Dict]) -> List[tuple]:
+    @staticmethod
+    def _create_sylt_data(word_timestamps: List[Dict]) -> List[tuple]:
         """
         Create SYLT data format from word timestamps
         
         Args:
-            word_timestamps: List of word timestamp dictionaries
+            word_timestamps: List of word timestamp dictionaries (milliseconds)
             
         Returns:
             List of tuples (text, timestamp_in_milliseconds)
         """
-        # Debug print to check incoming data
-        print(f"DEBUG: word_timestamps received in _create_sylt_data: {word_timestamps}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("word_timestamps received in _create_sylt_data: n=%d", len(word_timestamps))
         try:
             sylt_data = []
             
             for word_data in word_timestamps:
                 word = word_data.get('word', '').strip()
-                start_time = word_data.get('start', 0)
-                
                 if word:
-                    # Convert seconds to milliseconds
-                    timestamp_ms = int(start_time * 1000)
-                    sylt_data.append((word, timestamp_ms))
+                    # SYLT timestamps are milliseconds, like the word timestamps
+                    sylt_data.append((word, int(word_data.get('start', 0))))
             
             return sylt_data
             
@@ -148,7 +209,7 @@ class MP3Embedder:
         Create line-based SYLT data (alternative approach)
         
         Args:
-            word_timestamps: List of word timestamp dictionaries
+            word_timestamps: List of word timestamp dictionaries (milliseconds)
             max_words_per_line: Maximum words per line
             
         Returns:
@@ -165,8 +226,7 @@ class MP3Embedder:
                 if len(current_line) >= max_words_per_line:
                     if current_line:
                         line_text = ' '.join([w.get('word', '') for w in current_line]).strip()
-                        start_time = current_line[0].get('start', 0)
-                        timestamp_ms = int(start_time * 1000)
+                        timestamp_ms = int(current_line[0].get('start', 0))
                         
                         if line_text:
                             sylt_data.append((line_text, timestamp_ms))
@@ -176,8 +236,7 @@ class MP3Embedder:
             # Add remaining words as final line
             if current_line:
                 line_text = ' '.join([w.get('word', '') for w in current_line]).strip()
-                start_time = current_line[0].get('start', 0)
-                timestamp_ms = int(start_time * 1000)
+                timestamp_ms = int(current_line[0].get('start', 0))
                 
                 if line_text:
                     sylt_data.append((line_text, timestamp_ms))
@@ -193,42 +252,39 @@ class MP3Embedder:
         Verify that SYLT lyrics are properly embedded
         
         Args:
-            mp3_path: Path to the MP3 file
+            mp3_path: Path to the MP3 file, or a file object with its contents
             
         Returns:
             Dictionary with verification results
         """
+        result = {
+            'has_sylt': False,
+            'has_uslt': False,
+            'sylt_entries': 0,
+            'error': None
+        }
+        
         try:
-            audio_file = MP3(mp3_path)
-            
-            result = {
-                'has_sylt': False,
-                'has_uslt': False,
-                'sylt_entries': 0,
-                'error': None
-            }
-            
-            if audio_file.tags:
-                # Check for SYLT
-                sylt_frames = audio_file.tags.getall('SYLT')
-                if sylt_frames:
-                    result['has_sylt'] = True
-                    result['sylt_entries'] = len(sylt_frames[0].text) if sylt_frames[0].text else 0
-                
-                # Check for USLT (fallback)
-                uslt_frames = audio_file.tags.getall('USLT')
-                if uslt_frames:
-                    result['has_uslt'] = True
-            
+            # Only the tag block is inspected, so skip MP3() and its MPEG frame scan
+            tags = ID3(mp3_path)
+        except ID3NoHeaderError:
             return result
-            
         except Exception as e:
-            return {
-                'has_sylt': False,
-                'has_uslt': False,
-                'sylt_entries': 0,
-                'error': str(e)
-            }
+            result['error'] = str(e)
+            return result
+        
+        # Check for SYLT
+        sylt_frames = tags.getall('SYLT')
+        if sylt_frames:
+            result['has_sylt'] = True
+            result['sylt_entries'] = len(sylt_frames[0].text) if sylt_frames[0].text else 0
+        
+        # Check for USLT (fallback)
+        uslt_frames = tags.getall('USLT')
+        if uslt_frames:
+            result['has_uslt'] = True
+        
+        return result
     
     def extract_sylt_lyrics(self, mp3_path: str) -> List[Dict]:
         """
@@ -241,19 +297,20 @@ class MP3Embedder:
             List of dictionaries with text and timestamp
         """
         try:
-            audio_file = MP3(mp3_path)
             lyrics_data = []
             
-            if audio_file.tags:
-                sylt_frames = audio_file.tags.getall('SYLT')
-                
-                for frame in sylt_frames:
-                    if frame.text:
-                        for text, timestamp_ms in frame.text:
-                            lyrics_data.append({
-                                'text': text,
-                                'timestamp': timestamp_ms / 1000.0  # Convert to seconds
-                            })
+            try:
+                tags = ID3(mp3_path)
+            except ID3NoHeaderError:
+                return lyrics_data
+            
+            for frame in tags.getall('SYLT'):
+                if frame.text:
+                    for text, timestamp_ms in frame.text:
+                        lyrics_data.append({
+                            'text': text,
+                            'timestamp': timestamp_ms / 1000.0  # Convert to seconds
+                        })
             
             return lyrics_data
             
@@ -266,58 +323,140 @@ class MP3Embedder:
         Create an LRC (lyrics) file as an additional export option
         
         Args:
-            word_timestamps: List of word timestamp dictionaries
+            word_timestamps: List of word timestamp dictionaries (milliseconds)
             output_path: Path for the output LRC file
             
         Returns:
             Path to the created LRC file
         """
         try:
-            lrc_lines = []
+            lrc_buffer = io.StringIO()
             
-            # Group words into lines
-            current_line = []
-            for word_data in word_timestamps:
-                current_line.append(word_data)
-                
-                if len(current_line) >= 8:  # 8 words per line
-                    if current_line:
-                        line_text = ' '.join([w.get('word', '') for w in current_line])
-                        start_time = current_line[0].get('start', 0)
-                        
-                        # Format timestamp as [mm:ss.xx]
-                        minutes = int(start_time // 60)
-                        seconds = start_time % 60
-                        timestamp_str = f"[{minutes:02d}:{seconds:05.2f}]"
-                        
-                        lrc_lines.append(f"{timestamp_str}{line_text}")
-                        current_line = []
+            # Split every line's start time into [mm:ss.xx] fields up front, in centiseconds
+            line_starts = word_timestamps[::8]
+            start_ms = np.fromiter(
+                (w.get('start', 0) for w in line_starts), dtype=np.float64, count=len(line_starts)
+            ).astype(np.int64)
+            minutes, remaining_cs = np.divmod((start_ms + 5) // 10, 6000)
+            seconds, hundredths = np.divmod(remaining_cs, 100)
             
-            # Add remaining words
-            if current_line:
-                line_text = ' '.join([w.get('word', '') for w in current_line])
-                start_time = current_line[0].get('start', 0)
-                
-                minutes = int(start_time // 60)
-                seconds = start_time % 60
-                timestamp_str = f"[{minutes:02d}:{seconds:05.2f}]"
-                
-                lrc_lines.append(f"{timestamp_str}{line_text}")
+            # Group words into lines of 8
+            for line, (mm, ss, xx) in enumerate(zip(minutes.tolist(), seconds.tolist(), hundredths.tolist())):
+                if line:
+                    lrc_buffer.write('\n')
+                lrc_buffer.write(f"[{mm:02d}:{ss:02d}.{xx:02d}]")
+                lrc_buffer.write(' '.join(w.get('word', '') for w in word_timestamps[line * 8:line * 8 + 8]))
             
             # Write LRC file
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(lrc_lines))
+            with open(output_path, 'w', encoding='utf-8', buffering=1 << 16) as f:
+                f.write(lrc_buffer.getvalue())
             
             return output_path
             
         except Exception as e:
             raise Exception(f"Error creating LRC file: {str(e)}")
+
+
+def _embed_one(args: Tuple[str, List[Dict], str, str, bool]) -> Tuple[str, List[str]]:
+    """
+    Embed SYLT/USLT lyrics for a single file.
     
-    def __del__(self):
-        """Clean up temporary files"""
-        import shutil
-        if hasattr(self, 'temp_dir') and os.path.exists(self.temp_dir):
+    Lives at module level so it can be pickled and run in worker processes.
+    
+    Args:
+        args: Tuple of (audio_path, word_timestamps, text, output_path, ffmpeg_available)
+        
+    Returns:
+        Tuple of the output MP3 path and the log messages for this file
+    """
+    audio_path, word_timestamps, text, output_path, ffmpeg_available = args
+    log_messages = []
+    def log_and_print(message):
+        log_messages.append(message)
+        logger.info("%s", message)
+    log_and_print(f"--- MP3Embedder initialized. ffmpeg available: {ffmpeg_available} ---")
+    log_and_print(f"--- Starting SYLT embedding for: {os.path.basename(audio_path)} ---")
+    try:
+        # SYLT data only depends on the timestamps, so build it while ffmpeg converts
+        sylt_future = _get_sylt_pool().submit(MP3Embedder._create_sylt_data, word_timestamps)
+
+        # --- Step 1: Ensure the file is in MP3 format ---
+        # Only real MP3 output is tagged; ID3 prepended to a WAV/M4A would corrupt it
+        is_mp3 = True
+        if not audio_path.lower().endswith('.mp3'):
+            if ffmpeg_available:
+                log_and_print(f"'{os.path.basename(audio_path)}' is not an MP3. Converting with ffmpeg...")
+                converted, ffmpeg_error = MP3Embedder._convert_to_mp3(audio_path, output_path)
+                if converted:
+                    log_and_print("--- ffmpeg conversion successful. ---")
+                else:
+                    log_and_print("--- ERROR: ffmpeg conversion failed. ---")
+                    log_and_print(f"--- ffmpeg stderr: {ffmpeg_error} ---")
+                    log_and_print("--- Fallback: Copying original file without conversion. ---")
+                    _fast_copy(audio_path, output_path)
+                    is_mp3 = False
+            else:
+                log_and_print("--- WARNING: ffmpeg is not available. Cannot convert non-MP3 file. Copying directly. ---")
+                _fast_copy(audio_path, output_path)
+                is_mp3 = False
+        else:
+            log_and_print("--- Audio is already MP3. Copying to temporary location. ---")
+            _fast_copy(audio_path, output_path)
+
+        if not is_mp3:
+            sylt_future.cancel()
+            log_and_print("--- WARNING: Output is not an MP3 file. Skipping SYLT/USLT embedding. ---")
+            return output_path, log_messages
+
+        # --- Step 2: Create SYLT data ---
+        log_and_print("--- Creating SYLT data from timestamps... ---")
+        sylt_data = sylt_future.result()
+        if not sylt_data:
+            log_and_print("--- WARNING: No SYLT data could be created. Skipping embedding. ---")
+        else:
+            log_and_print(f"--- Created {len(sylt_data)} SYLT entries. ---")
+
+            # --- Step 3: Embed data into the MP3 file ---
             try:
-                shutil.rmtree(self.temp_dir)
-            except:
-                pass
+                log_and_print("--- Loading ID3 tags with mutagen... ---")
+                # Only the tag block changes, so skip MP3() and its MPEG frame scan
+                try:
+                    tags = ID3(output_path)
+                except ID3NoHeaderError:
+                    log_and_print("--- No ID3 tags found. Creating new ones. ---")
+                    tags = ID3()
+
+                # --- Embed SYLT (Synchronized Lyrics) ---
+                log_and_print("--- Creating and adding SYLT frame... ---")
+                sylt_frame = SYLT(
+                    encoding=Encoding.UTF8,
+                    lang='eng',
+                    format=2,
+                    type=1,
+                    text=sylt_data
+                )
+                tags.delall('SYLT')
+                tags.add(sylt_frame)
+
+                # --- Embed USLT (Unsynchronized Lyrics) as a fallback ---
+                log_and_print("--- Creating and adding USLT frame... ---")
+                uslt_frame = USLT(
+                    encoding=Encoding.UTF8,
+                    lang='eng',
+                    desc='',
+                    text=text
+                )
+                tags.delall('USLT')
+                tags.add(uslt_frame)
+
+                tags.save(output_path, v2_version=4)
+                log_and_print("--- Successfully embedded SYLT and USLT frames. ---")
+                
+            except Exception as e:
+                log_and_print(f"--- ERROR: Failed to embed SYLT/USLT: {e} ---")
+
+        return output_path, log_messages
+
+    except Exception as e:
+        log_and_print(f"--- ERROR: Unexpected error in embed_sylt_lyrics: {e} ---")
+        return output_path, log_messages
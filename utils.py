@@ -1,10 +1,16 @@
 import os
+import re
+import math
+import atexit
+import shutil
 import mimetypes
 import tempfile
+import threading
 from pathlib import Path
-from typing import Optional, List, Dict
-import librosa
-import numpy as np
+from typing import Optional, List, Dict, NamedTuple
+
+# Per-file caches are shared by every session, so they are bounded
+CACHE_MAX_ENTRIES = 128
 
 def format_timestamp(seconds: float) -> str:
     """
@@ -46,11 +52,19 @@ def validate_audio_file(file_path: str) -> bool:
         if mime_type and not mime_type.startswith('audio/'):
             return False
         
-        # Try to load with librosa to verify it's a valid audio file
+        # Parse the container header to verify it's a valid audio file
+        try:
+            import soundfile as sf
+            if sf.info(file_path).frames > 0:
+                return True
+        except Exception:
+            pass
+        
         try:
-            librosa.load(file_path, duration=1.0)  # Load just 1 second for validation
-            return True
-        except:
+            import mutagen
+            audio_file = mutagen.File(file_path, easy=True)
+            return audio_file is not None and audio_file.info.length > 0
+        except Exception:
             return False
             
     except Exception:
@@ -67,15 +81,28 @@ def get_audio_info(file_path: str) -> Dict:
         Dictionary with audio information
     """
     try:
-        # Load audio file
-        y, sr = librosa.load(file_path)
-        
-        duration = len(y) / sr
+        # Read the container header; decoding the whole file is the last resort
+        try:
+            import soundfile as sf
+            info = sf.info(file_path)
+            duration, sr, channels = info.frames / info.samplerate, info.samplerate, info.channels
+        except Exception:
+            import mutagen
+            audio_file = mutagen.File(file_path)
+            if audio_file is not None and audio_file.info.length > 0:
+                duration = audio_file.info.length
+                sr = getattr(audio_file.info, 'sample_rate', 0)
+                channels = getattr(audio_file.info, 'channels', 0)
+            else:
+                import librosa
+                y, sr = librosa.load(file_path, sr=None, mono=False)
+                duration = y.shape[-1] / sr
+                channels = 1 if len(y.shape) == 1 else y.shape[0]
         
         return {
             'duration': duration,
             'sample_rate': sr,
-            'channels': 1 if len(y.shape) == 1 else y.shape[0],
+            'channels': channels,
             'file_size': os.path.getsize(file_path),
             'format': Path(file_path).suffix.lower()
         }
@@ -90,6 +117,15 @@ def get_audio_info(file_path: str) -> Dict:
             'format': 'unknown'
         }
 
+# Runs of whitespace, optionally wrapping transcription artifacts like [Music] or (Applause)
+_CLEAN_TEXT_RE = re.compile(
+    r'\s*(?:(?:\[(?:Music|Applause|Laughter)\]|\((?:Music|Applause|Laughter)\))\s*)+|\s+'
+)
+
+def _clean_text_replacement(match: re.Match) -> str:
+    """Collapse a match to one space, or to nothing if it had no surrounding whitespace."""
+    return ' ' if any(char.isspace() for char in match.group(0)) else ''
+
 def clean_text(text: str) -> str:
     """
     Clean and normalize text for better processing
@@ -103,21 +139,8 @@ def clean_text(text: str) -> str:
     if not text:
         return ""
     
-    # Remove extra whitespace
-    text = ' '.join(text.split())
-    
-    # Remove common transcription artifacts
-    text = text.replace('[Music]', '')
-    text = text.replace('[Applause]', '')
-    text = text.replace('[Laughter]', '')
-    text = text.replace('(Music)', '')
-    text = text.replace('(Applause)', '')
-    text = text.replace('(Laughter)', '')
-    
-    # Clean up extra spaces
-    text = ' '.join(text.split())
-    
-    return text.strip()
+    # Drop transcription artifacts and collapse whitespace in a single pass
+    return _CLEAN_TEXT_RE.sub(_clean_text_replacement, text).strip()
 
 def split_text_into_chunks(text: str, max_chars_per_chunk: int = 100) -> List[str]:
     """
@@ -135,24 +158,21 @@ def split_text_into_chunks(text: str, max_chars_per_chunk: int = 100) -> List[st
     
     words = text.split()
     chunks = []
-    current_chunk = []
+    chunk_start = 0
     current_length = 0
     
-    for word in words:
-        word_length = len(word) + 1  # +1 for space
-        
-        if current_length + word_length > max_chars_per_chunk and current_chunk:
+    for i, word_length in enumerate([len(word) + 1 for word in words]):  # +1 for space
+        if current_length + word_length > max_chars_per_chunk and i > chunk_start:
             # Add current chunk and start new one
-            chunks.append(' '.join(current_chunk))
-            current_chunk = [word]
-            current_length = len(word)
+            chunks.append(' '.join(words[chunk_start:i]))
+            chunk_start = i
+            current_length = word_length - 1
         else:
-            current_chunk.append(word)
             current_length += word_length
     
     # Add final chunk
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
+    if chunk_start < len(words):
+        chunks.append(' '.join(words[chunk_start:]))
     
     return chunks
 
@@ -172,9 +192,7 @@ def convert_color_hex_to_rgb(hex_color: str) -> tuple:
         return (255, 255, 255)  # Default to white
     
     try:
-        r = int(hex_color[0:2], 16)
-        g = int(hex_color[2:4], 16)
-        b = int(hex_color[4:6], 16)
+        r, g, b = bytes.fromhex(hex_color)
         return (r, g, b)
     except ValueError:
         return (255, 255, 255)  # Default to white
@@ -189,7 +207,7 @@ def convert_rgb_to_hex(r: int, g: int, b: int) -> str:
     Returns:
         Hex color string
     """
-    return f"#{r:02x}{g:02x}{b:02x}"
+    return '#' + bytes((r & 0xff, g & 0xff, b & 0xff)).hex()
 
 def estimate_video_file_size(duration: float, resolution: tuple = (1280, 720), 
                            bitrate_kbps: int = 2000) -> int:
@@ -208,6 +226,9 @@ def estimate_video_file_size(duration: float, resolution: tuple = (1280, 720),
     estimated_size = (bitrate_kbps * 1000 * duration) / 8
     return int(estimated_size)
 
+_INVALID_FILENAME_RE = re.compile(r'[<>:"/\\|?*]')
+_FILENAME_COLLAPSE_RE = re.compile(r'[_\s]+')
+
 def create_safe_filename(filename: str) -> str:
     """
     Create a safe filename by removing/replacing invalid characters
@@ -218,13 +239,11 @@ def create_safe_filename(filename: str) -> str:
     Returns:
         Safe filename
     """
-    import re
-    
     # Remove or replace invalid characters
-    safe_filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
+    safe_filename = _INVALID_FILENAME_RE.sub('_', filename)
     
     # Remove extra underscores and spaces
-    safe_filename = re.sub(r'[_\s]+', '_', safe_filename)
+    safe_filename = _FILENAME_COLLAPSE_RE.sub('_', safe_filename)
     
     # Trim leading/trailing underscores
     safe_filename = safe_filename.strip('_')
@@ -235,6 +254,42 @@ def create_safe_filename(filename: str) -> str:
     
     return safe_filename
 
+_temp_dir = None
+_temp_dir_lock = threading.Lock()
+
+def get_temp_dir() -> str:
+    """
+    Return this process's temp directory, creating it on first use
+    
+    Uploads, session data and exports all live in this one directory, which
+    is removed when the interpreter exits.
+    
+    Returns:
+        Path to the temp directory
+    """
+    global _temp_dir
+    with _temp_dir_lock:
+        if _temp_dir is None:
+            _temp_dir = tempfile.mkdtemp(prefix='syncmaster_')
+            atexit.register(shutil.rmtree, _temp_dir, ignore_errors=True)
+        return _temp_dir
+
+def reserve_temp_file(filename: str) -> str:
+    """
+    Reserve a uniquely named file in the temp directory, so concurrent
+    exports of files with the same name don't overwrite each other
+    
+    Args:
+        filename: Desired file name; its stem and extension are kept
+        
+    Returns:
+        Path to the reserved (empty) file
+    """
+    stem, extension = os.path.splitext(filename)
+    fd, path = tempfile.mkstemp(prefix=f"{stem}_", suffix=extension, dir=get_temp_dir())
+    os.close(fd)
+    return path
+
 def format_file_size(size_bytes: int) -> str:
     """
     Format file size in human-readable format
@@ -249,21 +304,39 @@ def format_file_size(size_bytes: int) -> str:
         return "0 B"
     
     size_names = ["B", "KB", "MB", "GB"]
-    i = int(np.floor(np.log(size_bytes) / np.log(1024)))
-    p = np.power(1024, i)
-    s = round(size_bytes / p, 2)
+    # Each 1024x step is 10 more bits
+    i = min((size_bytes.bit_length() - 1) // 10, len(size_names) - 1)
+    s = round(size_bytes / (1 << (10 * i)), 2)
     
     return f"{s} {size_names[i]}"
 
-def validate_word_timestamps(word_timestamps: List[Dict]) -> List[Dict]:
+class WT(NamedTuple):
+    """A single timed word; start and end are integer milliseconds."""
+    word: str
+    start: int
+    end: int
+
+def to_dicts(word_timestamps: List[WT]) -> List[Dict]:
+    """
+    Convert timed words back to the word timestamp dictionaries used elsewhere
+    
+    Args:
+        word_timestamps: List of WT entries
+        
+    Returns:
+        List of {'word', 'start', 'end'} dictionaries
+    """
+    return [{'word': w.word, 'start': w.start, 'end': w.end} for w in word_timestamps]
+
+def validate_word_timestamps(word_timestamps: List[Dict]) -> List[WT]:
     """
     Validate and clean word timestamps data
     
     Args:
-        word_timestamps: List of word timestamp dictionaries
+        word_timestamps: List of word timestamp dictionaries (milliseconds)
         
     Returns:
-        Cleaned and validated word timestamps
+        Cleaned and validated word timestamps in integer milliseconds
     """
     validated_timestamps = []
     
@@ -273,8 +346,6 @@ def validate_word_timestamps(word_timestamps: List[Dict]) -> List[Dict]:
             continue
         
         word = word_data.get('word', '').strip()
-        start = word_data.get('start', 0)
-        end = word_data.get('end', 0)
         
         # Skip empty words
         if not word:
@@ -282,32 +353,34 @@ def validate_word_timestamps(word_timestamps: List[Dict]) -> List[Dict]:
         
         # Ensure numeric timestamps
         try:
-            start = float(start)
-            end = float(end)
+            start = float(word_data.get('start', 0))
+            end = float(word_data.get('end', 0))
         except (ValueError, TypeError):
             continue
+        if not (math.isfinite(start) and math.isfinite(end)):
+            continue
+        
+        # Round half up to whole milliseconds
+        start = int(start + 0.5)
+        end = int(end + 0.5)
         
         # Ensure logical timestamp order
         if start < 0:
             start = 0
         if end <= start:
-            end = start + 0.1  # Minimum duration
+            end = start + 100  # Minimum duration
         
-        validated_timestamps.append({
-            'word': word,
-            'start': round(start, 3),
-            'end': round(end, 3)
-        })
+        validated_timestamps.append(WT(word, start, end))
     
     return validated_timestamps
 
-def merge_overlapping_timestamps(word_timestamps: List[Dict], 
-                               overlap_threshold: float = 0.05) -> List[Dict]:
+def merge_overlapping_timestamps(word_timestamps: List[WT], 
+                               overlap_threshold: float = 0.05) -> List[WT]:
     """
     Merge overlapping or very close word timestamps
     
     Args:
-        word_timestamps: List of word timestamp dictionaries
+        word_timestamps: List of WT entries, as returned by validate_word_timestamps
         overlap_threshold: Threshold for merging close timestamps (seconds)
         
     Returns:
@@ -316,40 +389,21 @@ def merge_overlapping_timestamps(word_timestamps: List[Dict],
     if not word_timestamps:
         return []
     
+    overlap_threshold_ms = overlap_threshold * 1000
+    
     merged_timestamps = []
-    current_group = [word_timestamps[0]]
+    first = word_timestamps[0]
+    parts, group_start, group_end = [first.word], first.start, first.end
     
     for word_data in word_timestamps[1:]:
-        last_end = current_group[-1]['end']
-        current_start = word_data['start']
-        
         # Check if words should be merged
-        if current_start - last_end <= overlap_threshold:
-            current_group.append(word_data)
+        if word_data.start - group_end <= overlap_threshold_ms:
+            parts.append(word_data.word)
         else:
-            # Merge current group and start new one
-            if len(current_group) == 1:
-                merged_timestamps.append(current_group[0])
-            else:
-                # Merge multiple words
-                merged_word = {
-                    'word': ' '.join([w['word'] for w in current_group]),
-                    'start': current_group[0]['start'],
-                    'end': current_group[-1]['end']
-                }
-                merged_timestamps.append(merged_word)
-            
-            current_group = [word_data]
-    
-    # Handle final group
-    if len(current_group) == 1:
-        merged_timestamps.append(current_group[0])
-    else:
-        merged_word = {
-            'word': ' '.join([w['word'] for w in current_group]),
-            'start': current_group[0]['start'],
-            'end': current_group[-1]['end']
-        }
-        merged_timestamps.append(merged_word)
+            merged_timestamps.append(WT(' '.join(parts), group_start, group_end))
+            parts, group_start = [word_data.word], word_data.start
+        group_end = word_data.end
+    
+    merged_timestamps.append(WT(' '.join(parts), group_start, group_end))
     
     return merged_timestamps